@@ -9,25 +9,53 @@
 # raw_prefix      = "raw_submissions"
 # cur_bucket_name = "feedback-proto-ai-raw"   # 별도 버킷 쓰면 변경
 # cur_prefix      = "curated"
+# batch_prefix    = "batch_jobs"   # 배치 초안 입력/출력 (cur 버킷 아래)
+# batch_model     = "projects/800102005669/locations/us-central1/models/1234567890"   # 배치 초안용 모델 리소스(선택)
+#                   tunedModels/... 경로는 batch prediction이 받지 않으므로, 없으면 배치 초안 버튼이 비활성화됨
+# gzip_uploads    = true           # curated 저장 시 gzip(Content-Encoding) 압축, 기존 비압축 객체도 그대로 읽음
 #
 # [gcp_service_account]
 # ...서비스계정 JSON 원문 전체...
 # -----------------------------------------------------------
 
 from __future__ import annotations
+import gzip
 import io
 import json
+import re
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
-from typing import Dict, Any, List, Tuple
+from itertools import chain, islice
+from typing import Dict, Any, Iterator, List, Tuple
 
+try:
+    import orjson  # C 구현 JSON (권장)
+except ImportError:
+    orjson = None
 import streamlit as st
 import pandas as pd
+from google.api_core import exceptions as gexc
+from google.auth import exceptions as auth_exc
 from google.oauth2 import service_account
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
+from requests.adapters import HTTPAdapter
 
 import vertexai
-from vertexai.generative_models import GenerativeModel
+from vertexai.generative_models import GenerationConfig, GenerativeModel
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    # UTF-8 bytes 반환. orjson 없으면 표준 json으로 같은 형식 출력
+    if orjson is not None:
+        return orjson.dumps(obj, option=(orjson.OPT_INDENT_2 if indent else 0) | orjson.OPT_NON_STR_KEYS)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 # ---------------- 기본/Secrets ----------------
 st.set_page_config(page_title="🐸 개구리 학습 피드백 (Admin)", page_icon="🛠️", layout="wide")
@@ -41,31 +69,62 @@ RAW_PREFIX = (st.secrets.get("raw_prefix") or "raw_submissions").strip().strip("
 
 CUR_BUCKET = st.secrets.get("cur_bucket_name", RAW_BUCKET)
 CUR_PREFIX = (st.secrets.get("cur_prefix") or "curated").strip().strip("/")
+BATCH_PREFIX = (st.secrets.get("batch_prefix") or "batch_jobs").strip().strip("/")
+# batch prediction source_model은 모델 리소스 또는 퍼블리셔 Gemini 이름만 허용
+_BATCH_MODEL_RE = re.compile(r"^(projects/[^/]+/locations/[^/]+/models/[^/]+|publishers/google/models/[^/]+|gemini-[\w.-]+)$")
+BATCH_MODEL = (st.secrets.get("batch_model") or "").strip() or (TUNED_NAME if _BATCH_MODEL_RE.match(TUNED_NAME) else "")
+GZIP_UPLOADS = bool(st.secrets.get("gzip_uploads", True))
 
 if not (PROJECT_ID and LOCATION and TUNED_NAME and RAW_BUCKET and CUR_BUCKET):
     st.error("Secrets 설정이 부족합니다. project_id, location, tuned_model_name, raw/cur 버킷+프리픽스를 확인하세요.")
     st.stop()
 
 # ---------------- 인증/클라이언트 ----------------
-try:
+GCS_MAX_WORKERS = 32  # load_entries 동시 다운로드 수 (네트워크 RTT 바운드)
+GCS_PARALLEL_MIN = 8  # 이보다 적은 키는 순차 다운로드
+GCS_BATCH_MAX   = 100  # storage batch 요청당 최대 하위 요청 수
+GCS_HTTP_POOL   = 64  # urllib3 기본 풀(10)이면 병렬 다운로드가 커넥션 대기로 직렬화됨
+
+# 자격증명 파싱/vertexai.init/클라이언트 생성은 프로세스당 1회 (rerun마다 RSA 키 로드 방지)
+@st.cache_resource(show_spinner=False)
+def _init_clients(project: str, location: str) -> storage.Client:
     credentials = service_account.Credentials.from_service_account_info(
-        st.secrets["gcp_service_account"],
+        dict(st.secrets["gcp_service_account"]),
         scopes=["https://www.googleapis.com/auth/cloud-platform"],
     )
+    vertexai.init(project=project, location=location, credentials=credentials)
+    client = storage.Client(project=project, credentials=credentials)  # 스레드 간 공유
+
+    # 클라이언트 내부 AuthorizedSession(requests)에 큰 커넥션 풀 장착 — 내부 구조가 바뀌면 기본값 사용
+    http = getattr(client, "_http", None)
+    if hasattr(http, "mount"):
+        http.mount("https://", HTTPAdapter(pool_connections=GCS_HTTP_POOL, pool_maxsize=GCS_HTTP_POOL))
+    return client
+
+try:
+    storage_client = _init_clients(PROJECT_ID, LOCATION)
 except Exception as e:
     st.error("Secrets의 [gcp_service_account] JSON을 확인하세요.\n" + repr(e))
     st.stop()
 
-vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=credentials)
-storage_client = storage.Client(project=PROJECT_ID, credentials=credentials)
+SEARCH_FIELDS = ("prompt", "ai_response", "approved_response", "review_notes")  # 키워드 검색 대상
+LIST_MAX_WORKERS = 8   # 날짜 폴더별 LIST 동시 호출 수
+LIST_PER_DAY_MAX = 62  # 이보다 긴 기간은 prefix 전체 LIST 1회가 더 저렴
+EXPORT_PREVIEW_ROWS = 30  # 미리보기는 이만큼만 다운로드; 전체는 '파일 준비' 클릭 시
+MEMO_TODAY_TTL = 30  # 오늘이 포함된 범위의 session_state 재사용 시간(초) — 새 제출 반영용
+_MEMO_SLOTS = ("review_memo", "export_memo", "export_files")  # 저장/삭제 시 함께 비우는 session_state 항목
 
 # ---------------- 모델 호출 ----------------
-def _gen_cfg() -> Dict[str, Any]:
-    return {
-        "max_output_tokens": 2048,   # 필요시 4096
-        "temperature": 0.7,
-        "top_p": 0.95,
-    }
+GEN_PARAMS: Dict[str, Any] = {
+    "max_output_tokens": 2048,   # 필요시 4096
+    "temperature": 0.7,
+    "top_p": 0.95,
+}
+
+@st.cache_resource(show_spinner=False)
+def _gen_cfg(max_tokens: int) -> GenerationConfig:
+    # 출력 상한별로 1회만 생성해 재사용 (디코딩 시간은 출력 길이에 비례 → 사이드바에서 조절)
+    return GenerationConfig(**{**GEN_PARAMS, "max_output_tokens": max_tokens})
 
 def _extract_text(r) -> str:
     if getattr(r, "text", None):
@@ -81,29 +140,53 @@ def _extract_text(r) -> str:
                     pieces.append(t)
     return "\n".join(pieces).strip()
 
-def call_model(prompt: str) -> Tuple[str, Dict[str, Any]]:
-    meta: Dict[str, Any] = {"route": []}
+BASE_MODEL = "gemini-1.5-pro-002"  # 튜닝모델 실패 시 폴백
+# 폴백해도 소용없는(프로젝트/자격증명 공통) 오류 → 베이스모델 재호출 생략
+_FATAL_AUTH_ERRORS = (gexc.Unauthenticated, auth_exc.RefreshError, auth_exc.DefaultCredentialsError)
+
+@st.cache_resource(show_spinner=False)
+def _model(name: str) -> GenerativeModel:
+    # 모델 객체(채널/인증 메타데이터)를 프로세스 전체에서 재사용
+    return GenerativeModel(name)
+
+def _chunk_text(r) -> str:
+    # 스트리밍 청크용: 청크 경계 공백이 사라지지 않도록 strip 없이 이어붙임
+    return "".join(
+        getattr(p, "text", None) or ""
+        for c in getattr(r, "candidates", []) or []
+        for p in getattr(getattr(c, "content", None), "parts", None) or []
+    )
+
+def call_model(prompt: str, chunks: List[str], max_tokens: int, cfg: GenerationConfig,
+               tuned: GenerativeModel, base: GenerativeModel) -> Tuple[str, Dict[str, Any]]:
+    # 워커 스레드에서 실행 → st.cache_resource 호출 없이, 스크립트 스레드에서 꺼낸 모델/설정만 사용
+    # chunks: 튜닝모델 스트리밍 중 받은 조각을 append (다른 스레드에서 진행 상황 표시용)
+    meta: Dict[str, Any] = {"route": [], "max_output_tokens": max_tokens}
 
-    # 1) 튜닝모델 동기 호출
+    # 1) 튜닝모델 스트리밍 호출
     try:
-        gm = GenerativeModel(TUNED_NAME)
-        r = gm.generate_content(
+        for r in tuned.generate_content(
             contents=[{"role":"user","parts":[{"text":prompt}]}],
-            generation_config=_gen_cfg(),
-        )
-        text = _extract_text(r)
-        meta["route"].append({"name":"tuned-sync", "ok": bool(text)})
+            generation_config=cfg,
+            stream=True,
+        ):
+            if t := _chunk_text(r):
+                chunks.append(t)
+        text = "".join(chunks).strip()
+        meta["route"].append({"name":"tuned-stream", "ok": bool(text)})
         if text:
             return text, meta
     except Exception as e:
-        meta["route"].append({"name":"tuned-sync", "error": repr(e)})
+        meta["route"].append({"name":"tuned-stream", "error": repr(e)})
+        if isinstance(e, _FATAL_AUTH_ERRORS):
+            return "", meta  # 인증 문제는 베이스모델도 같은 자격증명이라 똑같이 실패
+    chunks.clear()
 
     # 2) 베이스모델 폴백
     try:
-        base = GenerativeModel("gemini-1.5-pro-002")
         r2 = base.generate_content(
             contents=[{"role":"user","parts":[{"text":prompt}]}],
-            generation_config=_gen_cfg(),
+            generation_config=cfg,
         )
         text2 = _extract_text(r2)
         meta["route"].append({"name":"base-sync", "ok": bool(text2)})
@@ -112,49 +195,310 @@ def call_model(prompt: str) -> Tuple[str, Dict[str, Any]]:
         meta["route"].append({"name":"base-sync", "error": repr(e)})
         return "", meta
 
+@st.cache_resource
+def _gen_executor() -> ThreadPoolExecutor:
+    # 모델 호출 전용(워커에서는 st.* 호출 없음, 결과값만 주고받음)
+    return ThreadPoolExecutor(max_workers=4)
+
+GEN_MEMO_MAX = 256  # 세션별 (모델, 프롬프트, 출력 상한) → 초안 메모 최대 개수
+
+def _gen_memo() -> Dict[Tuple[str, str, int], Tuple[str, Dict[str, Any]]]:
+    return st.session_state.setdefault("gen_memo", {})
+
+@st.fragment(run_every=0.5)
+def gen_poll():
+    # 백그라운드 생성 완료 여부만 확인 → 끝나면 결과 저장 후 전체 rerun
+    fut = st.session_state.get("gen_future")
+    if fut is None:
+        return
+    if not fut.done():
+        st.info("⏳ 생성 중... 다른 탭은 계속 사용할 수 있습니다.")
+        if partial := "".join(st.session_state.get("gen_chunks", [])):
+            st.markdown(partial)
+        return
+    del st.session_state["gen_future"]
+    try:
+        text, meta = fut.result()
+    except Exception as e:
+        text, meta = "", {"error": repr(e)}
+    st.session_state["admin_last_ai"] = text
+    st.session_state["admin_last_prompt"] = st.session_state.pop("gen_submitted_prompt", "")  # 초안을 만든 프롬프트
+    st.session_state["gen_meta"] = meta
+    memo_key = st.session_state.pop("gen_memo_key", None)
+    if text and memo_key is not None:
+        memo = _gen_memo()
+        memo[memo_key] = (text, meta)
+        while len(memo) > GEN_MEMO_MAX:
+            memo.pop(next(iter(memo)))  # 가장 오래된 항목부터 제거
+    st.rerun()
+
+# ---------------- 배치 초안 생성 ----------------
+# vertexai.batch_prediction은 배치 버튼을 누를 때만 import (aiplatform jobs 모듈 로드가 무거움)
+def submit_batch_drafts(prompts: List[str]) -> str:
+    # 프롬프트 목록 → JSONL 입력 업로드 → 튜닝모델 batch prediction 제출, job 리소스명 반환
+    if not BATCH_MODEL:
+        raise ValueError("배치용 모델 리소스(batch_model)가 설정되지 않았습니다.")
+    prompts = list(dict.fromkeys(p.strip() for p in prompts if (p or "").strip()))
+    if not prompts:
+        raise ValueError("배치로 보낼 프롬프트가 없습니다.")
+    job_dir = f"{BATCH_PREFIX}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    lines = [json_dumps({"request": {
+        "contents": [{"role":"user","parts":[{"text":p}]}],
+        "generationConfig": GEN_PARAMS,
+    }}) for p in prompts]
+    storage_client.bucket(CUR_BUCKET).blob(f"{job_dir}/input.jsonl").upload_from_string(
+        b"\n".join(lines), content_type="application/jsonl")
+    from vertexai.batch_prediction import BatchPredictionJob
+    job = BatchPredictionJob.submit(
+        source_model=BATCH_MODEL,
+        input_dataset=f"gs://{CUR_BUCKET}/{job_dir}/input.jsonl",
+        output_uri_prefix=f"gs://{CUR_BUCKET}/{job_dir}/output",
+    )
+    return job.resource_name
+
+def read_batch_drafts(job_name: str) -> Dict[str, str] | None:
+    # 실행 중이면 None, 완료 시 {prompt: 초안}
+    from vertexai.batch_prediction import BatchPredictionJob
+    job = BatchPredictionJob(job_name)
+    if not job.has_ended:
+        return None
+    if not job.has_succeeded:
+        raise RuntimeError(f"배치 작업 실패: {job.state} {job.error}")
+    bucket, _, prefix = job.output_location.removeprefix("gs://").partition("/")
+    drafts: Dict[str, str] = {}
+    for b in storage_client.list_blobs(bucket, prefix=f"{prefix}/", match_glob="**/*.jsonl"):
+        for line in b.download_as_bytes().splitlines():
+            if not line.strip():
+                continue
+            r = json_loads(line)
+            try:
+                prompt = r["request"]["contents"][0]["parts"][0]["text"]
+                parts = r["response"]["candidates"][0]["content"]["parts"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            text = "".join(p.get("text", "") for p in parts).strip()
+            if text:
+                drafts[prompt] = text
+    return drafts
+
 # ---------------- GCS 유틸 ----------------
-def gcs_upload_json(bucket: str, key: str, obj: Dict[str, Any]):
+def _put_json(bucket: str, key: str, obj: Dict[str, Any], if_generation_match: int | None = None):
     b = storage_client.bucket(bucket).blob(key)
-    data = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    data = json_dumps(obj, indent=True)
+    if GZIP_UPLOADS:
+        # GCS가 다운로드 시 자동 해제(decompressive transcoding) → 전송량 5~10배 감소
+        data = gzip.compress(data)
+        b.content_encoding = "gzip"
     b.cache_control = "no-cache"
-    b.upload_from_file(io.BytesIO(data), size=len(data), content_type="application/json")
+    b.upload_from_string(data, content_type="application/json",
+                         if_generation_match=if_generation_match, retry=DEFAULT_RETRY)
+
+def gcs_upload_json(bucket: str, key: str, obj: Dict[str, Any], if_generation_match: int | None = None):
+    # if_generation_match=0 → 새 객체만 생성(이미 있으면 PreconditionFailed)
+    try:
+        _put_json(bucket, key, obj, if_generation_match)
+    finally:
+        _bump_manifest(bucket, [key])
+        invalidate_entry_cache()
+
+# ---- curated 목록 캐시 버전(manifest) ----
+# curated는 이 앱만 쓰므로, 쓸 때마다 "<cur_prefix>/_manifest"를 갱신하고 그 generation을
+# 목록 캐시 키로 사용 → 변경이 없으면 목록을 다시 LIST하지 않음.
+# raw는 외부(학생용 앱)에서 쓰므로 1분 단위 시간 버킷을 버전으로 사용(기존 TTL 60초와 동일).
+def _manifest_name(prefix: str) -> str:
+    return f"{prefix}/_manifest"  # .json이 아니므로 목록(match_glob)에는 안 잡힘
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _manifest_generation(bucket: str, prefix: str) -> int:
+    b = storage_client.bucket(bucket).get_blob(_manifest_name(prefix))
+    return b.generation if b is not None else 0
+
+def _bump_manifest(bucket: str, keys: List[str]):
+    if bucket != CUR_BUCKET or not any(k.startswith(f"{CUR_PREFIX}/") for k in keys):
+        return
+    try:
+        ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        storage_client.bucket(bucket).blob(_manifest_name(CUR_PREFIX)).upload_from_string(
+            json_dumps({"updated_at": ts}), content_type="application/json")
+    except Exception:
+        pass  # 실패해도 목록 캐시는 ttl로 결국 갱신됨
+    _manifest_generation.clear()
+
+def listing_version(bucket: str, prefix: str) -> int:
+    if bucket == CUR_BUCKET and prefix == CUR_PREFIX:
+        try:
+            return _manifest_generation(bucket, prefix)
+        except Exception:
+            pass  # manifest 조회 실패 → raw와 같은 1분 버킷으로 대체
+    return int(time.time() // 60)
 
 def gcs_read_json(bucket: str, key: str) -> Dict[str, Any]:
-    return json.loads(storage_client.bucket(bucket).blob(key).download_as_bytes())
+    data = storage_client.bucket(bucket).blob(key).download_as_bytes()
+    if data[:2] == b"\x1f\x8b":  # 압축 상태 그대로 받은 경우(gzip magic)
+        data = gzip.decompress(data)
+    return json_loads(data)
+
+@st.cache_data(ttl=600, max_entries=5000, show_spinner=False)
+def _read_json_cached(bucket: str, key: str) -> Dict[str, Any]:
+    # 저장된 JSON은 사실상 불변 → rerun마다 재다운로드하지 않음 (반환값은 호출마다 복사본)
+    # max_entries = 내보내기 최대 로드 수(5000), 덮어쓰기는 업로드/삭제 시 무효화로 처리
+    return gcs_read_json(bucket, key)
 
 def gcs_delete(bucket: str, key: str):
     storage_client.bucket(bucket).blob(key).delete()
+    invalidate_entry_cache()
 
-@st.cache_data(ttl=60)
-def list_keys(bucket: str, prefix: str) -> List[str]:
+def gcs_delete_many(bucket: str, keys: List[str]):
+    # JSON API batch: 요청 1회에 삭제 최대 GCS_BATCH_MAX건
+    if not keys:
+        return
+    b = storage_client.bucket(bucket)
     try:
-        blobs = storage_client.list_blobs(bucket, prefix=f"{prefix}/")
-        keys = [b.name for b in blobs if b.name.endswith(".json")]
-        keys.sort(reverse=True)
-        return keys
-    except Exception as e:
-        st.warning(f"키 목록 로드 실패: {e}")
-        return []
+        for i in range(0, len(keys), GCS_BATCH_MAX):
+            with storage_client.batch():
+                for k in keys[i:i + GCS_BATCH_MAX]:
+                    b.blob(k).delete()
+    finally:
+        invalidate_entry_cache()
+
+def invalidate_entry_cache():
+    _read_json_cached.clear()
+    load_entries_cached.clear()
+    for slot in _MEMO_SLOTS:
+        st.session_state.pop(slot, None)
+
+# 목록 캐시: 실패는 예외로 올려 캐시하지 않음(호출측 load_range_memo에서 경고)
+# max_entries: raw는 1분마다 버전이 바뀌므로 지난 버전이 ttl 동안 쌓이지 않게 제한
+@st.cache_data(ttl=3600, max_entries=32)
+def _list_all_keys(bucket: str, prefix: str, version: int) -> List[str]:
+    # version: listing_version() — 바뀌면 캐시 미스
+    # name 필드만 받고(.json 필터는 서버측 glob) → 목록 응답 페이로드 최소화
+    blobs = storage_client.list_blobs(
+        bucket,
+        prefix=f"{prefix}/",
+        match_glob="**/*.json",
+        fields="items(name),nextPageToken",
+        page_size=1000,
+    )
+    keys = [b.name for b in blobs if key_date(b.name)]  # 날짜 폴더 밖 파일은 어떤 기간 필터에도 안 걸림
+    keys.sort(reverse=True)  # prefix가 같으므로 이름 역순 = 날짜 내림차순(같은 날은 이름 역순)
+    return keys
 
 def key_date(key: str) -> str:
-    parts = key.split("/")
-    return parts[1] if len(parts) >= 3 else ""
+    # "<prefix>/YYYY-MM-DD/<file>" → "YYYY-MM-DD" (split 없이 고정 길이 슬라이스)
+    i = key.find("/") + 1
+    if i and key.find("/", i) == i + 10:
+        return key[i:i + 10]
+    return ""
+
+def _desc_bound(keys: List[str], day: str, inclusive: bool) -> int:
+    # 날짜 내림차순 keys에서 key_date < day (inclusive면 <=) 가 처음 성립하는 위치
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        d = key_date(keys[mid])
+        if d < day or (inclusive and d == day):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
 
 def filter_keys_by_date(keys: List[str], start: date, end: date) -> List[str]:
+    # keys는 _list_all_keys 결과(날짜 내림차순)여야 함
     s, e = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-    return [k for k in keys if (d:=key_date(k)) and (s <= d <= e)]
+    return keys[_desc_bound(keys, e, inclusive=True):_desc_bound(keys, s, inclusive=False)]
+
+def _list_day(bucket: str, prefix: str, day: str) -> List[str]:
+    blobs = storage_client.list_blobs(
+        bucket,
+        prefix=f"{prefix}/{day}/",
+        match_glob="**/*.json",
+        fields="items(name),nextPageToken",
+    )
+    return sorted((b.name for b in blobs), reverse=True)  # 전체 목록과 같은 순서(이름 역순)
+
+@st.cache_data(ttl=3600, max_entries=64)
+def list_keys(bucket: str, prefix: str, start: date, end: date, limit: int | None = None,
+              version: int = 0) -> List[str]:
+    # 기간 내 날짜 폴더만 병렬 LIST (최신 날짜 먼저). 기간이 길면 전체 목록 + 날짜 필터
+    # limit: 최신 limit건만 반환 — 채워지면 남은(더 오래된) 날짜 LIST는 취소
+    n_days = (end - start).days + 1
+    if n_days <= 0:
+        return []
+    if n_days > LIST_PER_DAY_MAX:
+        return filter_keys_by_date(_list_all_keys(bucket, prefix, version), start, end)[:limit]
+    days = pd.date_range(start, end)[::-1].strftime("%Y-%m-%d").tolist()
+    ex = ThreadPoolExecutor(max_workers=min(LIST_MAX_WORKERS, n_days))
+    try:
+        day_lists = ex.map(lambda d: _list_day(bucket, prefix, d), days)
+        return list(islice(chain.from_iterable(day_lists), limit))
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
 
-def load_entries(bucket: str, keys: List[str]) -> List[Dict[str, Any]]:
-    out = []
-    for k in keys:
-        try:
-            d = gcs_read_json(bucket, k)
-            d["_bucket"] = bucket
-            d["_key"] = k
-            out.append(d)
-        except Exception:
-            pass
-    return out
+def _read_entry(bucket: str, key: str) -> Dict[str, Any] | None:
+    try:
+        d = _read_json_cached(bucket, key)
+    except Exception:
+        return None
+    d["_bucket"] = bucket
+    d["_key"] = key
+    d["_search_blob"] = " ".join((d.get(f) or "") for f in SEARCH_FIELDS).lower()
+    return d
+
+def iter_entries(bucket: str, keys: List[str], kw: str = "") -> Iterator[Dict[str, Any]]:
+    # 키 순서(최신순)대로 yield, 실패 항목과 키워드 불일치 항목은 도착 즉시 버림.
+    # 동시 요청은 GCS_MAX_WORKERS*2 창으로 제한 → 소비측이 중간에 멈추면 남은 다운로드는 취소
+    pat = keyword_pattern(kw)
+    def keep(d: Dict[str, Any] | None) -> bool:
+        # match = 문자열 처음에서만 시도 → 불일치 항목에서 위치별 재탐색 없음
+        return d is not None and (pat is None or pat.match(d["_search_blob"]) is not None)
+    if len(keys) < GCS_PARALLEL_MIN:
+        # 몇 건이면 스레드 풀 생성 비용이 더 큼
+        for k in keys:
+            if keep(d := _read_entry(bucket, k)):
+                yield d
+        return
+    it = iter(keys)
+    ex = ThreadPoolExecutor(max_workers=min(GCS_MAX_WORKERS, len(keys)))
+    try:
+        window = deque(ex.submit(_read_entry, bucket, k) for k in islice(it, GCS_MAX_WORKERS * 2))
+        while window:
+            d = window.popleft().result()
+            for k in islice(it, 1):
+                window.append(ex.submit(_read_entry, bucket, k))
+            if keep(d):
+                yield d
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+
+def load_entries(bucket: str, keys: List[str], kw: str = "") -> List[Dict[str, Any]]:
+    return list(iter_entries(bucket, keys, kw))
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_entries_cached(bucket: str, keys: Tuple[str, ...], kw: str = "") -> List[Dict[str, Any]]:
+    return load_entries(bucket, list(keys), kw)
+
+def load_range_memo(slot: str, bucket: str, prefix: str, start: date, end: date, limit: int,
+                    kw: str = "", first: int | None = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+    # 필터가 같으면 이전 (keys, entries) 재사용 (지난 날짜 디렉터리는 바뀌지 않음)
+    # first: 앞쪽 일치 항목만 필요할 때(미리보기) 그 수만큼만 다운로드
+    memo_key = (bucket, prefix, start, end, limit, kw, first)
+    memo = st.session_state.get(slot)
+    if memo and memo["key"] == memo_key and (
+        end < date.today() or time.monotonic() - memo["at"] < MEMO_TODAY_TTL
+    ):
+        return memo["keys"], memo["entries"]
+    try:
+        keys = list_keys(bucket, prefix, start, end, limit, listing_version(bucket, prefix))
+    except Exception as e:
+        st.warning(f"키 목록 로드 실패: {e}")
+        return [], []  # 실패 결과는 memo에도 남기지 않음 → 다음 rerun에서 재시도
+    if first is None:
+        entries = load_entries_cached(bucket, tuple(keys), kw)
+    else:
+        entries = list(islice(iter_entries(bucket, keys, kw), first))
+    st.session_state[slot] = {"key": memo_key, "at": time.monotonic(), "keys": keys, "entries": entries}
+    return keys, entries
 
 def curated_key_from_raw(raw_key: str) -> str:
     parts = raw_key.split("/", 2)
@@ -163,35 +507,130 @@ def curated_key_from_raw(raw_key: str) -> str:
     day = datetime.utcnow().strftime("%Y-%m-%d")
     return f"{CUR_PREFIX}/{day}/{uuid.uuid4().hex[:10]}.json"
 
-def contains_kw(e: Dict[str, Any], kw: str) -> bool:
-    if not kw:
-        return True
-    kw = kw.lower()
-    for f in ("prompt", "ai_response", "approved_response", "review_notes"):
-        if kw in (e.get(f, "") or "").lower():
-            return True
-    return False
-
-def to_jsonl_lines(entries: List[Dict[str, Any]]) -> List[str]:
-    lines = []
+def keyword_pattern(kw: str) -> re.Pattern | None:
+    # 공백으로 나눈 단어를 모두 포함(AND)하는지 검사하는 정규식, 키워드 없으면 None
+    terms = kw.strip().lower().split()
+    if not terms:
+        return None
+    return re.compile("".join(f"(?=.*{re.escape(t)})" for t in terms), re.S)
+
+def to_jsonl_lines(entries: List[Dict[str, Any]]) -> Iterator[bytes]:
+    # 인코딩된 한 줄씩 yield → 호출측에서 BytesIO에 바로 기록
     for e in entries:
         prompt = (e.get("prompt") or "").strip()
         out = (e.get("approved_response") or e.get("ai_response") or "").strip()
         if not prompt or not out:
             continue
-        lines.append(json.dumps({"contents":[
+        yield json_dumps({"contents":[
             {"role":"user","parts":[{"text":prompt}]},
             {"role":"model","parts":[{"text":out}]},
-        ]}, ensure_ascii=False))
-    return lines
+        ]}) + b"\n"
 
 def to_dataframe(entries: List[Dict[str, Any]]) -> pd.DataFrame:
     cols = ["timestamp","prompt","ai_response","approved_response","approved_by","approved_at",
             "review_notes","used_model","source_raw_bucket","source_raw_key","_bucket","_key"]
-    rows = []
-    for e in entries:
-        rows.append({c: e.get(c) for c in cols})
-    return pd.DataFrame(rows, columns=cols)
+    # 열 단위로 바로 구성 (행 dict를 거치지 않음), 없는 키는 None
+    return pd.DataFrame({c: [e.get(c) for e in entries] for c in cols}, columns=cols, copy=False)
+
+# ---------------- 리뷰 상세 (fragment) ----------------
+def review_labels(entries: List[Dict[str, Any]]) -> List[str]:
+    # "날짜 | 프롬프트 앞 40자…" 라벨을 pandas 문자열 연산으로 한 번에 생성
+    if not entries:
+        return []
+    dates = pd.Series([e.get("timestamp") or key_date(e.get("_key","")) for e in entries], dtype=object)
+    prompts = pd.Series([e.get("prompt") or "" for e in entries], dtype=object).str.replace("\n", " ", regex=False)
+    ellipsis = prompts.str.len().gt(40).map({True: "…", False: ""})
+    return (dates.astype(str) + " | " + prompts.str.slice(0, 40) + ellipsis).tolist()
+
+def _review_step(n: int, idx: int, delta: int):
+    # 콜백에서 위젯 상태를 바꾸므로 st.rerun() 없이 fragment만 다시 그려짐
+    j = idx + delta
+    if 0 <= j < n:
+        st.session_state["review_select"] = j
+
+def _delete_selected(entries: List[Dict[str, Any]]):
+    # 콜백: 삭제 후 선택 초기화 (rerun 전에 실행되므로 위젯 상태 변경 가능)
+    sel = set(st.session_state.get("review_delete_sel", []))
+    keys = [e["_key"] for e in entries if e["_key"] in sel]
+    try:
+        gcs_delete_many(RAW_BUCKET, keys)
+        st.session_state["review_delete_msg"] = ("info", f"raw {len(keys)}건 삭제 완료")
+    except Exception as e:
+        st.session_state["review_delete_msg"] = ("warning", f"일괄 삭제 실패: {e}")
+    st.session_state["review_delete_sel"] = []
+
+@st.fragment
+def review_detail(entries: List[Dict[str, Any]], labels: List[str]):
+    # 항목 선택/저장/이전·다음은 이 영역만 rerun (GCS 목록·로드 재실행 없음)
+    # 위젯 값은 entries 인덱스(-1 = 선택 안 함) → 라벨 문자열 역검색 불필요
+    if st.session_state.get("review_select", -1) >= len(entries):
+        st.session_state["review_select"] = -1
+    idx = st.selectbox(
+        "검토할 항목",
+        options=[-1, *range(len(entries))],
+        format_func=lambda i: "(선택)" if i < 0 else labels[i],
+        index=0,
+        key="review_select",
+    )
+
+    if idx >= 0:
+        item = entries[idx]
+
+        st.subheader("원본 제출")
+        st.write("제출시각:", item.get("timestamp"))
+        st.write("프롬프트:"); st.code(item.get("prompt",""))
+        st.write("AI 초안:");  st.text_area("원본 AI 초안", item.get("ai_response",""), height=220, key="review_ai_text")
+
+        batch_draft = st.session_state.get("batch_drafts", {}).get((item.get("prompt") or "").strip())
+        if batch_draft:
+            st.write("배치 초안:"); st.text_area("배치 AI 초안", batch_draft, height=220, key="review_batch_text")
+
+        st.subheader("✍️ 승인본(수정/보완)")
+        # form: 승인본/메모를 편집하는 동안 rerun 없음, '승인 저장' 때 한 번에 반영
+        with st.form("review_approve_form", border=False):
+            approved_text = st.text_area(
+                "최종 피드백",
+                value=item.get("approved_response", batch_draft or item.get("ai_response","")),
+                height=260,
+                key="review_approved_text"
+            )
+            cba, cbb, cbc = st.columns([1,1,1])
+            with cba:
+                delete_after = st.checkbox("승인 후 raw 삭제", value=False, key="review_delete_after")
+            with cbb:
+                notes = st.text_input("관리자 메모(선택)", value=item.get("review_notes",""), key="review_notes")
+            with cbc:
+                ok = st.form_submit_button("✅ 승인 저장", type="primary")
+
+        if ok:
+            try:
+                ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+                out = {
+                    **{k: v for k, v in item.items() if k != "_search_blob"},
+                    "approved_response": approved_text.strip(),
+                    "approved_by": "admin",
+                    "approved_at": ts,
+                    "review_notes": notes,
+                    "source_raw_bucket": item.get("_bucket"),
+                    "source_raw_key": item.get("_key"),
+                }
+                out_key = curated_key_from_raw(item.get("_key",""))
+                gcs_upload_json(CUR_BUCKET, out_key, out)
+                st.success(f"curated 저장 완료 → gs://{CUR_BUCKET}/{out_key}")
+                if delete_after:
+                    try:
+                        gcs_delete(item.get("_bucket"), item.get("_key"))
+                        st.info("원본(raw) 삭제 완료")
+                    except Exception as de:
+                        st.warning(f"원본 삭제 실패: {de}")
+            except Exception as e:
+                st.error("승인 저장 실패"); st.exception(e)
+
+        prev, nxt = st.columns([1,1])
+        with prev:
+            st.button("◀ 이전", key="review_prev_btn", on_click=_review_step, args=(len(entries), idx, -1))
+        with nxt:
+            st.button("다음 ▶", key="review_next_btn", on_click=_review_step, args=(len(entries), idx, +1))
 
 # ---------------- 사이드바 ----------------
 with st.sidebar:
@@ -202,6 +641,9 @@ with st.sidebar:
     st.write("---")
     st.write(f"raw: `gs://{RAW_BUCKET}/{RAW_PREFIX}`")
     st.write(f"curated: `gs://{CUR_BUCKET}/{CUR_PREFIX}`")
+    st.write("---")
+    max_tok = st.slider("최대 출력 토큰", 256, 2048, 1024, 64, key="gen_max_tok",
+                        help="초안 생성 출력 상한. 낮을수록 빨리 끝납니다. (배치 초안은 기본값 사용)")
 
 # ---------------- 탭 구성 ----------------
 tab_gen, tab_review, tab_export = st.tabs(["🧪 생성(초안)", "🗂️ 제출 리뷰", "📦 데이터 내보내기"])
@@ -211,34 +653,51 @@ with tab_gen:
     st.header("🧪 생성(초안)")
     prompt = st.text_area("학생의 상황을 자세히 입력:", height=180, key="gen_prompt")
 
-    if st.button("AI 초안 생성", use_container_width=True, key="gen_btn"):
+    pending = st.session_state.get("gen_future") is not None
+    if st.button("AI 초안 생성", use_container_width=True, key="gen_btn", disabled=pending):
+        memo_key = (TUNED_NAME, prompt, max_tok)
         if not prompt.strip():
             st.warning("프롬프트를 입력하세요.")
+        elif memo_key in _gen_memo():
+            # 같은 프롬프트 재생성 → 세션 메모 재사용 (모델 호출 없음)
+            text, meta = _gen_memo()[memo_key]
+            st.session_state["admin_last_ai"] = text
+            st.session_state["admin_last_prompt"] = prompt
+            st.session_state["gen_meta"] = {**meta, "memo": True}
+        else:
+            st.session_state["gen_memo_key"] = memo_key
+            st.session_state["gen_submitted_prompt"] = prompt  # 생성 중 입력창을 고쳐도 저장은 이 프롬프트로
+            st.session_state["gen_chunks"] = chunks = []
+            st.session_state["gen_future"] = _gen_executor().submit(
+                call_model, prompt, chunks, max_tok,
+                _gen_cfg(max_tok), _model(TUNED_NAME), _model(BASE_MODEL))
+    if st.session_state.get("gen_future") is not None:
+        gen_poll()
+
+    gen_meta = st.session_state.pop("gen_meta", None)
+    if gen_meta is not None:
+        if st.session_state.get("admin_last_ai"):
+            st.success("초안 생성 완료")
         else:
-            with st.spinner("생성 중..."):
-                text, meta = call_model(prompt)
-                if text:
-                    st.session_state["admin_last_ai"] = text
-                    st.success("초안 생성 완료")
-                else:
-                    st.session_state["admin_last_ai"] = ""
-                    st.warning("모델이 빈 응답을 반환했습니다.")
-                    with st.expander("디버그"):
-                        st.json(meta)
+            st.warning("모델이 빈 응답을 반환했습니다.")
+            with st.expander("디버그"):
+                st.json(gen_meta)
 
     if st.session_state.get("admin_last_ai"):
         st.subheader("🤖 AI 초안")
         st.text_area("AI 초안 출력", st.session_state["admin_last_ai"], height=280, key="gen_output")
 
         st.subheader("✍️ 최종 승인본 → curated 저장")
-        approved = st.text_area("최종 피드백", value=st.session_state["admin_last_ai"], height=260, key="gen_approved")
-        if st.button("✅ 승인 저장(새 항목)", type="primary", key="gen_save_btn"):
+        with st.form("gen_approve_form", border=False):
+            approved = st.text_area("최종 피드백", value=st.session_state["admin_last_ai"], height=260, key="gen_approved")
+            gen_save = st.form_submit_button("✅ 승인 저장(새 항목)", type="primary")
+        if gen_save:
             try:
                 ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
                 day = datetime.utcnow().strftime("%Y-%m-%d")
                 out = {
                     "timestamp": ts,
-                    "prompt": prompt,
+                    "prompt": st.session_state.get("admin_last_prompt", ""),
                     "ai_response": st.session_state["admin_last_ai"],
                     "approved_response": approved.strip(),
                     "approved_by": "admin",
@@ -249,7 +708,7 @@ with tab_gen:
                     "source_raw_key": None,
                 }
                 key = f"{CUR_PREFIX}/{day}/{uuid.uuid4().hex[:10]}.json"
-                gcs_upload_json(CUR_BUCKET, key, out)
+                gcs_upload_json(CUR_BUCKET, key, out, if_generation_match=0)
                 st.success(f"curated 저장 완료: gs://{CUR_BUCKET}/{key}")
             except Exception as e:
                 st.error("저장 실패"); st.exception(e)
@@ -258,119 +717,103 @@ with tab_gen:
 with tab_review:
     st.header("🗂️ 제출 리뷰")
     today = date.today()
-    c1,c2,c3,c4 = st.columns([1,1,1,1])
-    with c1:
-        start_d = st.date_input("시작일", value=today - timedelta(days=7), key="review_start_date")
-    with c2:
-        end_d   = st.date_input("종료일", value=today, key="review_end_date")
-    with c3:
-        kw = st.text_input("키워드(프롬프트/응답/메모 검색)", "", key="review_kw")
-    with c4:
-        limit = st.number_input("최대 로드 수", min_value=50, max_value=3000, value=600, step=50, key="review_limit")
-
-    all_keys = list_keys(RAW_BUCKET, RAW_PREFIX)
-    keys = filter_keys_by_date(all_keys, start_d, end_d)[: int(limit)]
-    entries = load_entries(RAW_BUCKET, keys)
-    if kw.strip():
-        entries = [e for e in entries if contains_kw(e, kw)]
+    # form: 입력 중에는 rerun 없음, '적용'을 눌러야 필터 값이 반영됨
+    with st.form("review_filter"):
+        c1,c2,c3,c4 = st.columns([1,1,1,1])
+        with c1:
+            start_d = st.date_input("시작일", value=today - timedelta(days=7), key="review_start_date")
+        with c2:
+            end_d   = st.date_input("종료일", value=today, key="review_end_date")
+        with c3:
+            kw = st.text_input("키워드(프롬프트/응답/메모 검색, 공백=AND)", "", key="review_kw")
+        with c4:
+            limit = st.number_input("최대 로드 수", min_value=50, max_value=3000, value=600, step=50, key="review_limit")
+        st.form_submit_button("적용")
+
+    _, entries = load_range_memo("review_memo", RAW_BUCKET, RAW_PREFIX, start_d, end_d, int(limit), kw.strip())
     st.caption(f"필터 결과: {len(entries)}건")
 
-    def label_of(e):
-        d = e.get("timestamp") or key_date(e.get("_key",""))
-        p = (e.get("prompt") or "").replace("\n"," ")
-        return f"{d} | {p[:40]}{'…' if len(p)>40 else ''}"
-
-    options = ["(선택)"] + [label_of(e) for e in entries]
-    sel = st.selectbox("검토할 항목", options, index=0, key="review_select")
-
-    if sel != "(선택)":
-        idx = options.index(sel) - 1
-        item = entries[idx]
-
-        st.subheader("원본 제출")
-        st.write("제출시각:", item.get("timestamp"))
-        st.write("프롬프트:"); st.code(item.get("prompt",""))
-        st.write("AI 초안:");  st.text_area("원본 AI 초안", item.get("ai_response",""), height=220, key="review_ai_text")
-
-        st.subheader("✍️ 승인본(수정/보완)")
-        approved_text = st.text_area(
-            "최종 피드백",
-            value=item.get("approved_response", item.get("ai_response","")),
-            height=260,
-            key="review_approved_text"
-        )
-        cba, cbb, cbc = st.columns([1,1,1])
-        with cba:
-            delete_after = st.checkbox("승인 후 raw 삭제", value=False, key="review_delete_after")
-        with cbb:
-            notes = st.text_input("관리자 메모(선택)", value=item.get("review_notes",""), key="review_notes")
-        with cbc:
-            ok = st.button("✅ 승인 저장", type="primary", key="review_save_btn")
-
-        if ok:
-            try:
-                ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-                out = {
-                    **item,
-                    "approved_response": approved_text.strip(),
-                    "approved_by": "admin",
-                    "approved_at": ts,
-                    "review_notes": notes,
-                    "source_raw_bucket": item.get("_bucket"),
-                    "source_raw_key": item.get("_key"),
-                }
-                out_key = curated_key_from_raw(item.get("_key",""))
-                gcs_upload_json(CUR_BUCKET, out_key, out)
-                st.success(f"curated 저장 완료 → gs://{CUR_BUCKET}/{out_key}")
-                if delete_after:
-                    try:
-                        gcs_delete(item.get("_bucket"), item.get("_key"))
-                        st.info("원본(raw) 삭제 완료")
-                    except Exception as de:
-                        st.warning(f"원본 삭제 실패: {de}")
-            except Exception as e:
-                st.error("승인 저장 실패"); st.exception(e)
-
-        prev, nxt = st.columns([1,1])
-        with prev:
-            if st.button("◀ 이전", key="review_prev_btn"):
-                if idx-1 >= 0:
-                    st.session_state["review_select"] = options[idx]
-                    st.rerun()
-        with nxt:
-            if st.button("다음 ▶", key="review_next_btn"):
-                if idx+1 < len(entries):
-                    st.session_state["review_select"] = options[idx+2]
-                    st.rerun()
+    with st.expander("🧺 배치 초안 생성 (필터된 항목 일괄)"):
+        st.caption("실시간 호출 대신 Vertex batch prediction으로 초안을 만듭니다. 완료까지 수 분~수십 분 걸리며 비용은 약 절반입니다.")
+        if not BATCH_MODEL:
+            st.caption("⚠️ tuned_model_name이 모델 리소스(projects/…/models/…)가 아니라 배치 제출을 할 수 없습니다. Secrets에 batch_model을 설정하세요.")
+        bc1, bc2 = st.columns([1,1])
+        with bc1:
+            if st.button("배치 초안 생성", key="batch_submit_btn", disabled=not (entries and BATCH_MODEL)):
+                try:
+                    st.session_state["batch_job"] = submit_batch_drafts([e.get("prompt") for e in entries])
+                    st.success(f"배치 작업 제출 완료: `{st.session_state['batch_job']}`")
+                except Exception as e:
+                    st.error("배치 제출 실패"); st.exception(e)
+        with bc2:
+            batch_job = st.session_state.get("batch_job")
+            if st.button("결과 불러오기", key="batch_poll_btn", disabled=not batch_job):
+                try:
+                    drafts = read_batch_drafts(batch_job)
+                    if drafts is None:
+                        st.info("아직 실행 중입니다. 잠시 후 다시 확인하세요.")
+                    else:
+                        st.session_state["batch_drafts"] = drafts
+                        st.success(f"배치 초안 {len(drafts)}건을 불러왔습니다.")
+                except Exception as e:
+                    st.error("결과 로드 실패"); st.exception(e)
+
+    labels = review_labels(entries)
+
+    with st.expander("🗑️ raw 일괄 삭제"):
+        # 선택 값은 GCS 키 → 필터가 바뀌어도 다른 항목을 가리키지 않음
+        label_by_key = {e["_key"]: l for e, l in zip(entries, labels)}
+        st.session_state["review_delete_sel"] = [
+            k for k in st.session_state.get("review_delete_sel", []) if k in label_by_key
+        ]
+        del_sel = st.multiselect("삭제할 항목", options=list(label_by_key), format_func=label_by_key.get, key="review_delete_sel")
+        st.button("선택 삭제", key="review_delete_btn", disabled=not del_sel,
+                  on_click=_delete_selected, args=(entries,))
+        if msg := st.session_state.pop("review_delete_msg", None):
+            getattr(st, msg[0])(msg[1])
+
+    review_detail(entries, labels)
 
 # === 탭 3: 데이터 내보내기 ===
 with tab_export:
     st.header("📦 데이터 내보내기 (curated)")
-    c1,c2,c3,c4 = st.columns([1,1,1,1])
-    with c1:
-        s2 = st.date_input("시작일", value=date.today()-timedelta(days=30), key="export_start_date")
-    with c2:
-        e2 = st.date_input("종료일", value=date.today(), key="export_end_date")
-    with c3:
-        kw2 = st.text_input("키워드", "", key="export_kw")
-    with c4:
-        lim2 = st.number_input("최대 로드 수", min_value=50, max_value=5000, value=1500, step=50, key="export_limit")
-
-    ckeys_all = list_keys(CUR_BUCKET, CUR_PREFIX)
-    ckeys = filter_keys_by_date(ckeys_all, s2, e2)[: int(lim2)]
-    centries = load_entries(CUR_BUCKET, ckeys)
-    if kw2.strip():
-        centries = [e for e in centries if contains_kw(e, kw2)]
-    st.caption(f"필터 결과: {len(centries)}건")
-
-    if centries:
-        df = to_dataframe(centries)
-        st.dataframe(df.head(30), use_container_width=True, key="export_df")
-
-        csv_bytes = df.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-        st.download_button("⬇️ CSV 다운로드", data=csv_bytes, file_name="curated_export.csv", mime="text/csv", key="export_csv")
-
-        jsonl_bytes = ("\n".join(to_jsonl_lines(centries))).encode("utf-8")
-        st.download_button("⬇️ JSONL 다운로드 (Vertex 튜닝용)", data=jsonl_bytes, file_name="curated_tuning.jsonl", mime="application/json", key="export_jsonl")
+    with st.form("export_filter"):
+        c1,c2,c3,c4 = st.columns([1,1,1,1])
+        with c1:
+            s2 = st.date_input("시작일", value=date.today()-timedelta(days=30), key="export_start_date")
+        with c2:
+            e2 = st.date_input("종료일", value=date.today(), key="export_end_date")
+        with c3:
+            kw2 = st.text_input("키워드(공백=AND)", "", key="export_kw")
+        with c4:
+            lim2 = st.number_input("최대 로드 수", min_value=50, max_value=5000, value=1500, step=50, key="export_limit")
+        st.form_submit_button("적용")
+
+    # 미리보기: 조건에 맞는 앞쪽 항목만 받아오고 나머지 다운로드는 중단
+    ckeys, preview = load_range_memo("export_memo", CUR_BUCKET, CUR_PREFIX, s2, e2, int(lim2),
+                                     kw2.strip(), first=EXPORT_PREVIEW_ROWS)
+    st.caption(f"대상 키 {len(ckeys)}건 · 미리보기 {len(preview)}건")
+
+    if preview:
+        st.dataframe(to_dataframe(preview), use_container_width=True, key="export_df")
+
+        export_key = (CUR_BUCKET, CUR_PREFIX, s2, e2, kw2, int(lim2))
+        if st.button("📦 내보내기 파일 준비(전체 로드)", key="export_prepare_btn"):
+            with st.spinner("전체 항목 로드 중..."):
+                centries = load_entries_cached(CUR_BUCKET, tuple(ckeys), kw2.strip())
+                csv_buf = io.BytesIO()
+                to_dataframe(centries).to_csv(csv_buf, index=False, encoding="utf-8-sig")
+                jsonl_buf = io.BytesIO()
+                jsonl_buf.writelines(to_jsonl_lines(centries))
+                st.session_state["export_files"] = {
+                    "key": export_key, "n": len(centries),
+                    "csv": csv_buf.getvalue(), "jsonl": jsonl_buf.getvalue(),
+                }
+
+        files = st.session_state.get("export_files")
+        if files and files["key"] == export_key:
+            st.caption(f"내보내기 대상: {files['n']}건")
+            st.download_button("⬇️ CSV 다운로드", data=files["csv"], file_name="curated_export.csv", mime="text/csv", key="export_csv")
+            st.download_button("⬇️ JSONL 다운로드 (Vertex 튜닝용)", data=files["jsonl"], file_name="curated_tuning.jsonl", mime="application/json", key="export_jsonl")
     else:
         st.info("내보낼 데이터가 없습니다. 날짜/키워드를 조정해 보세요.")
@@ -1,7 +1,18 @@
 # app.py — Google GenAI (Vertex 모드) + 튜닝/엔드포인트 지원
 
+import csv
+import functools
+import hashlib
+import io
+import json
+import queue
+import re
+import tempfile
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 
 from google import genai
@@ -11,15 +22,38 @@ from google.oauth2 import service_account
 st.set_page_config(page_title="학습 피드백 AI", page_icon="🐸", layout="centered")
 
 # ── Secrets ──
-PROJECT_ID     = st.secrets.get("project_id", "feedback-ai-prototype-ver05")
-LOCATION       = st.secrets.get("location", "us-central1")
-PROJECT_NUMBER = st.secrets.get("project_number", "800102005669")  # 있으면 사용
-RAW_TUNED      = (st.secrets.get("tuned_model_name") or "").strip()
-ENDPOINT_NAME  = (st.secrets.get("endpoint_name") or "").strip()   # ★ 새로 추가
+# secrets 조회/정규화는 1회만 하고 결과를 재사용 (rerun마다 반복 조회 방지)
+@st.cache_data(show_spinner=False)
+def _cfg() -> dict:
+    s = st.secrets
+    cfg = dict(
+        project_id=s.get("project_id", "feedback-ai-prototype-ver05"),
+        location=s.get("location", "us-central1"),
+        project_number=s.get("project_number", "800102005669"),  # 있으면 사용
+        tuned=(s.get("tuned_model_name") or "").strip(),
+        endpoint=(s.get("endpoint_name") or "").strip(),   # ★ 새로 추가
+        hedge_after_s=float(s.get("hedge_after_s", 2.0)),  # 튜닝 모델 첫 응답이 이보다 늦으면 베이스 병렬 호출
+        batch_bucket=(s.get("batch_bucket") or "").strip(),  # 설정 시 배치 모드 사용 가능 (입출력 JSONL 저장 버킷)
+        batch_model=(s.get("batch_model") or "").strip(),    # 배치용 모델 리소스(선택, 없으면 tuned_model_name)
+        batch_prefix=(s.get("batch_prefix") or "batch_jobs").strip().strip("/"),
+    )
+    # 짧은 tunedModels 경로면 풀 경로로 보정
+    if cfg["tuned"].startswith("tunedModels/"):
+        cfg["tuned"] = f"projects/{cfg['project_number']}/locations/{cfg['location']}/{cfg['tuned']}"
+    return cfg
 
-# 짧은 tunedModels 경로면 풀 경로로 보정
-if RAW_TUNED and RAW_TUNED.startswith("tunedModels/"):
-    RAW_TUNED = f"projects/{PROJECT_NUMBER}/locations/{LOCATION}/{RAW_TUNED}"
+CFG = _cfg()
+PROJECT_ID     = CFG["project_id"]
+LOCATION       = CFG["location"]
+PROJECT_NUMBER = CFG["project_number"]
+RAW_TUNED      = CFG["tuned"]
+ENDPOINT_NAME  = CFG["endpoint"]
+HEDGE_AFTER_S  = CFG["hedge_after_s"]
+BATCH_BUCKET   = CFG["batch_bucket"]
+# 배치 작업은 엔드포인트가 아니라 모델 리소스(projects/…/models/…) 또는 퍼블리셔 Gemini만 받음
+_BATCH_MODEL_RE = re.compile(r"^(projects/[^/]+/locations/[^/]+/(models|publishers/google/models)/[^/]+|gemini-[\w.-]+)$")
+BATCH_MODEL    = CFG["batch_model"] or (RAW_TUNED if _BATCH_MODEL_RE.match(RAW_TUNED) else "")
+BATCH_PREFIX   = CFG["batch_prefix"]
 
 # 최종 호출에 쓸 모델 리소스(엔드포인트 우선)
 MODEL_RESOURCE = ENDPOINT_NAME or RAW_TUNED
@@ -29,24 +63,76 @@ if not MODEL_RESOURCE:
 
 # ── 인증(스코프 필수) ──
 SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
-try:
-    credentials = service_account.Credentials.from_service_account_info(
-        st.secrets["gcp_service_account"],
+HTTP_TIMEOUT_MS = 60_000   # 요청 타임아웃(ms)
+HTTP_KEEPALIVE_S = 300     # httpx 기본(5초)이면 클릭 간격마다 커넥션이 닫혀 TLS 재연결
+
+# 자격증명/클라이언트는 프로세스당 1회만 생성 (클릭마다 키 파싱·채널 생성 방지)
+@st.cache_resource(show_spinner=False)
+def _credentials() -> service_account.Credentials:
+    return service_account.Credentials.from_service_account_info(
+        dict(st.secrets["gcp_service_account"]),
         scopes=SCOPES,
     )
-except Exception as e:
-    st.error("Secrets의 [gcp_service_account]가 올바르지 않습니다.\n" + repr(e))
-    st.stop()
 
-client = genai.Client(
-    vertexai=True,
-    project=PROJECT_ID,
-    location=LOCATION,
-    credentials=credentials,
-)
+@st.cache_resource(show_spinner=False)
+def get_client(project: str, location: str) -> genai.Client:
+    return genai.Client(
+        vertexai=True,
+        project=project,
+        location=location,
+        credentials=_credentials(),
+        http_options=types.HttpOptions(
+            timeout=HTTP_TIMEOUT_MS,
+            client_args={"limits": httpx.Limits(max_keepalive_connections=10, keepalive_expiry=HTTP_KEEPALIVE_S)},
+        ),
+    )
+
+# 기록 열람/다운로드만 하는 세션은 자격증명·클라이언트를 만들지 않음 → 모델 호출 직전에 ensure_client()
+client = None
+
+def ensure_client():
+    global client
+    if client is not None:
+        return
+    try:
+        client = get_client(PROJECT_ID, LOCATION)
+    except Exception as e:
+        # 자격증명 외에도 httpx/SDK 버전 문제 등으로 실패할 수 있음 → 실제 예외를 그대로 표시
+        st.error("Vertex AI 클라이언트를 만들지 못했습니다. (Secrets의 [gcp_service_account] 및 패키지 버전 확인)")
+        st.exception(e)
+        st.stop()
 
 # ── 상태 ──
-if "log" not in st.session_state: st.session_state.log = []
+LOG_COLUMNS = ["timestamp", "prompt", "ai_response", "approved_response", "used_model"]
+
+def _csv_row(values) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue().encode("utf-8")
+
+def reset_log():
+    f = st.session_state.log_file
+    f.seek(0)
+    f.truncate()
+    f.write(b"\xef\xbb\xbf" + _csv_row(LOG_COLUMNS))  # utf-8-sig BOM + 헤더
+    f.flush()
+    st.session_state.log_count = 0
+    st.session_state.pop("last_saved_key", None)
+
+def append_log(row: dict):
+    f = st.session_state.log_file
+    f.seek(0, io.SEEK_END)
+    f.write(_csv_row([row.get(k, "") for k in LOG_COLUMNS]))
+    f.flush()
+    st.session_state.log_count += 1
+    # 마지막으로 기록된 행의 키 → 같은 내용을 연달아 저장하는지 판별 (일괄/배치 기록 포함)
+    st.session_state.last_saved_key = text_key(row.get("prompt", ""), row.get("ai_response", ""),
+                                               row.get("approved_response", ""))
+
+# 세션 로그는 메모리 리스트 대신 세션별 임시 CSV 파일에 한 줄씩 append (세션 종료 시 자동 삭제)
+if "log_file" not in st.session_state:
+    st.session_state.log_file = tempfile.TemporaryFile()
+    reset_log()
 if "last_ai" not in st.session_state: st.session_state.last_ai = ""
 if "last_prompt" not in st.session_state: st.session_state.last_prompt = ""
 if "used_model" not in st.session_state: st.session_state.used_model = MODEL_RESOURCE
@@ -61,6 +147,9 @@ with st.sidebar:
     st.write(f"tuned_model_name: `{RAW_TUNED or '(미설정)'}`")
     st.write(f"effective model: `{MODEL_RESOURCE}`")
     st.write(f"scopes: `{', '.join(SCOPES)}`")
+    st.markdown("---")
+    # Flash: 반복 수정 중 빠른 초안용, 최종본은 튜닝 모델로 생성
+    fast_mode = st.radio("모델", ["튜닝(정식)", "Flash(빠른 초안)"], horizontal=True) == "Flash(빠른 초안)"
     if st.session_state.tuned_error:
         st.warning("지정 모델 호출 실패 → 베이스 모델 폴백 사용 중")
         st.exception(st.session_state.tuned_error)
@@ -69,86 +158,410 @@ with st.sidebar:
 st.title("🐸 독T의 학습 피드백 AI")
 st.markdown("---")
 user_prompt = st.text_area("학생의 상황을 자세히 입력해주세요:", height=180)
+# 2.5 계열은 thinking 토큰도 상한에 포함 → 너무 낮으면 빈/잘린 답변
+max_len = st.slider("답변 최대 길이", 256, 2048, 1024, step=64, help="출력 토큰 상한. 낮을수록 빨리 끝나지만 답변이 잘릴 수 있습니다.")
+batch_mode = bool(BATCH_BUCKET and BATCH_MODEL) and st.checkbox("배치 모드로 누적 처리", help="즉시 생성하지 않고 큐에 쌓았다가 배치 작업으로 한 번에 처리합니다(비용 절감, 수 분~수 시간 소요).")
+if "batch_queue" not in st.session_state: st.session_state.batch_queue = []
+if "batch_jobs" not in st.session_state: st.session_state.batch_jobs = []
 
-col1, col2 = st.columns(2)
-with col1: gen_clicked = st.button("피드백 생성하기", use_container_width=True)
-with col2: clear_clicked = st.button("화면 초기화", use_container_width=True)
-
-if clear_clicked:
+# 초기화는 on_click 콜백에서 상태만 비움 → 클릭으로 인한 실행 1회로 끝 (st.rerun 재실행 없음)
+def clear_screen():
     st.session_state.last_ai = ""
     st.session_state.last_prompt = ""
     st.session_state.used_model = MODEL_RESOURCE
     st.session_state.tuned_error = None
-    st.rerun()
+    st.session_state.pop("gen_future", None)  # 진행 중인 생성 결과는 버림
+
+pending = st.session_state.get("gen_future") is not None
+col1, col2 = st.columns(2)
+with col1: gen_clicked = st.button("피드백 생성하기", use_container_width=True, disabled=pending)
+with col2: st.button("화면 초기화", use_container_width=True, on_click=clear_screen)
 
 # ── 호출 함수 ──
-def call_model(model_name: str, prompt_text: str) -> str:
-    resp = client.models.generate_content(
+BASE_MODEL = f"projects/{PROJECT_NUMBER}/locations/{LOCATION}/publishers/google/models/gemini-2.5-pro"
+FLASH_MODEL = f"projects/{PROJECT_NUMBER}/locations/{LOCATION}/publishers/google/models/gemini-2.5-flash"
+
+BATCH_MAX_ITEMS = 8  # 한 번에 묶어 보낼 최대 상황 수
+
+# 설정 객체는 상한값별로 1회만 생성해 재사용
+@functools.lru_cache(maxsize=16)
+def _gen_cfg(max_tokens: int, no_thinking: bool = False) -> types.GenerateContentConfig:
+    # no_thinking: Flash는 사고(thinking) 토큰을 끄고 바로 답변 → 첫 토큰 지연/출력 상한 소모 감소
+    return types.GenerateContentConfig(
+        temperature=0.7, max_output_tokens=max_tokens,
+        thinking_config=types.ThinkingConfig(thinking_budget=0) if no_thinking else None,
+    )
+
+def _user_content(prompt_text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=prompt_text)])
+
+def _stream_text(model_name: str, prompt_text: str, max_tokens: int = 1024):
+    stream = client.models.generate_content_stream(
         model=model_name,  # ★ 엔드포인트 또는 튜닝 리소스
-        contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt_text)])],
-        config=types.GenerateContentConfig(
-            temperature=0.7,
-            max_output_tokens=1024,
-        ),
+        contents=[_user_content(prompt_text)],
+        config=_gen_cfg(max_tokens, no_thinking=model_name == FLASH_MODEL),
     )
-    return resp.text or ""
+    for chunk in stream:
+        yield chunk.text or ""
+
+def _collect_stream(pieces, chunks=None) -> str:
+    # chunks: 백그라운드 실행 중 받은 조각을 모아 두는 리스트 (폴링 fragment가 읽음)
+    buf = []
+    for piece in pieces:
+        buf.append(piece)
+        if chunks is not None:
+            chunks.append(piece)
+    return "".join(buf)
+
+def call_model(model_name: str, prompt_text: str, max_tokens: int = 1024, chunks=None) -> str:
+    # 토큰 스트리밍으로 받아 전체 텍스트 반환
+    return _collect_stream(_stream_text(model_name, prompt_text, max_tokens), chunks)
+
+def _hedge_worker(model_name: str, prompt_text: str, max_tokens: int, q: queue.Queue, stop: threading.Event):
+    # 워커 스레드는 화면에 쓰지 않고 (모델, 조각, 에러)만 큐로 전달; 조각 None = 스트림 종료
+    try:
+        for piece in _stream_text(model_name, prompt_text, max_tokens):
+            if stop.is_set():
+                return
+            q.put((model_name, piece, None))
+        q.put((model_name, None, None))
+    except Exception as e:
+        q.put((model_name, None, e))
+
+def call_model_flash(prompt_text: str, max_tokens: int = 1024, chunks=None):
+    # 빠른 초안: Flash 단독 호출 (헤지/폴백 없음), 반환 형식은 call_model_hedged와 동일
+    try:
+        return call_model(FLASH_MODEL, prompt_text, max_tokens, chunks), FLASH_MODEL, {}
+    except Exception as e:
+        return None, None, {FLASH_MODEL: e}
+
+def call_model_hedged(prompt_text: str, max_tokens: int = 1024, chunks=None):
+    # 튜닝 모델이 HEDGE_AFTER_S 안에 첫 조각을 못 주거나 실패하면 베이스를 병렬로 띄우고 먼저 응답한 쪽 채택
+    # 반환: (텍스트 또는 None, 채택 모델, {모델: 에러})
+    q, stops, errors = queue.Queue(), {}, {}
+
+    def start(m):
+        stops[m] = threading.Event()
+        threading.Thread(target=_hedge_worker, args=(m, prompt_text, max_tokens, q, stops[m]), daemon=True).start()
+
+    start(MODEL_RESOURCE)
+    winner = first = None
+    while winner is None:
+        try:
+            m, piece, err = q.get(timeout=HEDGE_AFTER_S if BASE_MODEL not in stops else None)
+        except queue.Empty:
+            start(BASE_MODEL)
+            continue
+        if err is None:
+            winner, first = m, piece
+        else:
+            errors[m] = err
+            if BASE_MODEL not in stops:
+                start(BASE_MODEL)
+            elif len(errors) == len(stops):
+                return None, None, errors
+    for m, ev in stops.items():
+        if m != winner:
+            ev.set()  # 진행 중인 HTTP는 끊을 수 없으니 다음 조각에서 종료
+
+    def pieces():
+        if first is None:
+            return
+        yield first
+        while True:
+            m, piece, err = q.get()
+            if m != winner:
+                continue
+            if err is not None:
+                raise err
+            if piece is None:
+                return
+            yield piece
+
+    try:
+        return _collect_stream(pieces(), chunks), winner, errors
+    except Exception as e:
+        errors[winner] = e
+        if winner != MODEL_RESOURCE:
+            return None, None, errors
+    # 튜닝 모델이 스트리밍 도중 실패 → 베이스로 순차 폴백
+    if chunks is not None:
+        chunks.clear()
+    try:
+        return call_model(BASE_MODEL, prompt_text, max_tokens, chunks), BASE_MODEL, errors
+    except Exception as e:
+        errors[BASE_MODEL] = e
+        return None, None, errors
+
+# ── 실행 (백그라운드) ──
+@st.cache_resource(show_spinner=False)
+def _gen_executor() -> ThreadPoolExecutor:
+    # 모델 호출 전용(워커에서는 st.* 호출 없음, 결과값만 주고받음)
+    return ThreadPoolExecutor(max_workers=4)
+
+GEN_MEMO_MAX = 256  # 세션별 (모델, 입력, 상한) → 결과 메모 최대 개수
+
+def text_key(*texts: str) -> str:
+    # 입력 원문 대신 64비트 다이제스트를 메모/중복 저장 판별 키로 사용
+    h = hashlib.blake2b(digest_size=8)
+    for t in texts:
+        h.update(t.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+if "gen_memo" not in st.session_state: st.session_state.gen_memo = {}
+
+@st.fragment(run_every=0.5)
+def gen_poll():
+    # 백그라운드 생성 완료 여부만 확인 → 끝나면 결과 저장 후 전체 rerun
+    fut = st.session_state.get("gen_future")
+    if fut is None:
+        return
+    if not fut.done():
+        st.info("⏳ AI가 강사님의 철학으로 답변을 생성 중입니다...")
+        if partial := "".join(st.session_state.get("gen_chunks", [])):
+            st.markdown(partial)
+        return
+    del st.session_state["gen_future"]
+    try:
+        ai_text, used_model, errors = fut.result()
+    except Exception as e:
+        ai_text, used_model, errors = None, None, {"": e}
+    if used_model != FLASH_MODEL and FLASH_MODEL not in errors:
+        st.session_state.tuned_error = errors.get(MODEL_RESOURCE)  # Flash 실행은 튜닝 모델 상태를 바꾸지 않음
+    prompt_text = st.session_state.pop("gen_prompt", "")
+    memo_key = st.session_state.pop("gen_key", None)
+    requested = st.session_state.pop("gen_model", None)
+    if ai_text is None:
+        st.session_state.gen_errors = list(errors.values())
+    elif not ai_text.strip():
+        st.session_state.gen_empty = used_model  # 빈/차단 응답은 메모하지 않음 → 재클릭 시 다시 호출
+    else:
+        st.session_state.used_model = used_model
+        st.session_state.last_ai = ai_text
+        st.session_state.last_prompt = prompt_text
+        if used_model == requested:  # 헤지로 다른 모델이 이긴 결과는 메모하지 않음 (키는 요청 모델 기준)
+            memo = st.session_state.gen_memo
+            memo[memo_key] = (ai_text, used_model)
+            while len(memo) > GEN_MEMO_MAX:
+                memo.pop(next(iter(memo)))  # 가장 오래된 항목부터 제거
+    st.rerun()
 
-# ── 실행 ──
 if gen_clicked:
     if not user_prompt.strip():
         st.warning("학생의 상황을 입력해주세요.")
+    elif batch_mode:
+        st.session_state.batch_queue.append(user_prompt.strip())
+        st.success(f"배치 큐에 추가했습니다. (대기 {len(st.session_state.batch_queue)}건)")
+    elif (key := text_key((req_model := FLASH_MODEL if fast_mode else MODEL_RESOURCE), user_prompt, str(max_len))) in st.session_state.gen_memo:
+        # 같은 입력 재클릭 → 이전 결과 재사용 (모델 호출 없음)
+        ai_text, used_model = st.session_state.gen_memo[key]
+        st.session_state.used_model = used_model
+        st.session_state.last_ai = ai_text
+        st.session_state.last_prompt = user_prompt
+        if used_model == MODEL_RESOURCE:  # Flash 메모 재사용은 튜닝 모델 상태를 바꾸지 않음
+            st.session_state.tuned_error = None
     else:
-        with st.spinner("AI가 강사님의 철학으로 답변을 생성 중입니다..."):
-            try:
-                ai_text = call_model(MODEL_RESOURCE, user_prompt)
-                st.session_state.used_model = MODEL_RESOURCE
-                st.session_state.tuned_error = None
-            except Exception as tuned_err:
-                st.session_state.tuned_error = tuned_err
-                # 베이스 모델(퍼블리셔 경로) 폴백
-                base_model = f"projects/{PROJECT_NUMBER}/locations/{LOCATION}/publishers/google/models/gemini-2.5-pro"
-                try:
-                    ai_text = call_model(base_model, user_prompt)
-                    st.session_state.used_model = base_model
-                except Exception as base_err:
-                    st.error("답변 생성 중 오류가 발생했습니다.")
-                    st.exception(tuned_err)
-                    st.exception(base_err)
-                    raise
-            st.session_state.last_ai = ai_text
-            st.session_state.last_prompt = user_prompt
+        ensure_client()  # 워커 스레드 시작 전에 메인 스레드에서 생성
+        st.session_state.gen_prompt = user_prompt
+        st.session_state.gen_key = key
+        st.session_state.gen_model = req_model
+        st.session_state.gen_chunks = chunks = []
+        st.session_state.gen_future = _gen_executor().submit(
+            call_model_flash if fast_mode else call_model_hedged,
+            user_prompt, max_len, chunks)
+        pending = True
+
+if pending:
+    gen_poll()
+
+if empty_model := st.session_state.pop("gen_empty", None):
+    st.warning(f"모델이 빈 응답을 반환했습니다. (사용 모델: `{empty_model}`) 다시 생성하거나 입력을 조금 바꿔보세요.")
+
+if errs := st.session_state.pop("gen_errors", None):
+    st.error("답변 생성 중 오류가 발생했습니다.")
+    for err in errs:
+        st.exception(err)
 
 # ── 결과/저장 ──
 if st.session_state.last_ai:
     st.subheader("🤖 AI 초안")
     st.caption(f"사용한 모델: `{st.session_state.used_model}`")
-    st.write(st.session_state.last_ai)
+    st.markdown(st.session_state.last_ai)  # 문자열 전용 경로 (st.write의 타입 판별 생략)
 
     st.markdown("### ✍️ 최종 승인용: 수정/보완해서 저장")
-    approved = st.text_area(
-        "필요하면 아래에서 직접 고쳐서 '기록 저장'을 누르세요.",
-        value=st.session_state.last_ai,
-        height=240,
-        key="approved_area",
+    # 폼 안에서 편집 → 타이핑 중에는 rerun 없음, 저장 클릭 시 1회만 실행
+    with st.form("save_form", border=False):
+        approved = st.text_area(
+            "필요하면 아래에서 직접 고쳐서 '기록 저장'을 누르세요.",
+            value=st.session_state.last_ai,
+            height=240,
+            key="approved_area",
+        )
+        submitted = st.form_submit_button("기록 저장", type="primary")
+    if submitted:
+        save_key = text_key(st.session_state.last_prompt, st.session_state.last_ai, approved.strip())
+        if save_key == st.session_state.get("last_saved_key"):
+            st.toast("방금 저장한 내용과 같아 다시 기록하지 않았습니다.", icon="ℹ️")
+        else:
+            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            append_log({
+                "timestamp": ts,
+                "prompt": st.session_state.last_prompt,
+                "ai_response": st.session_state.last_ai,
+                "approved_response": approved.strip(),
+                "used_model": st.session_state.used_model,
+            })
+            st.toast("기록되었습니다 ✅", icon="💾")
+
+# ── 여러 상황 일괄 생성 (1회 호출) ──
+def split_numbered(text: str, n: int) -> dict:
+    # "[1] ... [2] ..." 형식 응답을 번호별로 분리
+    parts = re.split(r"\n?\[(\d+)\]\s*", text)
+    out = {}
+    for i in range(1, len(parts) - 1, 2):
+        idx = int(parts[i])
+        if 1 <= idx <= n and idx not in out:
+            out[idx] = parts[i + 1].strip()
+    return out
+
+with st.expander("📚 여러 상황 한 번에 생성"):
+    batch_text = st.text_area(f"여러 상황을 한 줄씩 입력 (최대 {BATCH_MAX_ITEMS}개)", height=160, key="batch_text")
+    if st.button("일괄 생성", key="batch_gen"):
+        items = [ln.strip() for ln in batch_text.splitlines() if ln.strip()][:BATCH_MAX_ITEMS]
+        if not items:
+            st.warning("상황을 한 줄 이상 입력해주세요.")
+        else:
+            ensure_client()
+            batch_prompt = (
+                "다음 각 상황에 대해 피드백을 작성하세요. 각 답변은 해당 번호([1], [2], ...)로 시작하세요.\n"
+                + "\n".join(f"[{i}] {t}" for i, t in enumerate(items, 1))
+            )
+            max_tokens = min(1024 * len(items), 8192)
+            resp_text, batch_errors = None, []
+            with st.spinner(f"{len(items)}개 상황을 한 번에 생성 중..."):
+                for batch_model in (MODEL_RESOURCE, BASE_MODEL):  # 튜닝 모델 실패 시 베이스로 폴백
+                    try:
+                        resp_text = call_model(batch_model, batch_prompt, max_tokens=max_tokens)
+                        break
+                    except Exception as e:
+                        batch_errors.append(e)
+            if resp_text is None:
+                st.error("일괄 생성 중 오류가 발생했습니다. (튜닝 모델·베이스 모델 모두 실패)")
+                for err in batch_errors:
+                    st.exception(err)
+            else:
+                outs = split_numbered(resp_text, len(items))
+                ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for i, t in enumerate(items, 1):
+                    if i in outs:
+                        append_log({
+                            "timestamp": ts,
+                            "prompt": t,
+                            "ai_response": outs[i],
+                            "approved_response": "",  # 일괄 초안은 검토 전 상태로 기록
+                            "used_model": batch_model,
+                        })
+                st.success(f"{len(outs)}/{len(items)}개 초안을 기록했습니다. (승인본은 비어 있음)")
+                if len(outs) < len(items):
+                    st.warning("응답에서 번호를 찾지 못한 상황은 기록하지 않았습니다. 해당 상황은 개별 생성해주세요.")
+
+# ── 배치 작업 (batch_bucket 설정 시) ──
+@st.cache_resource(show_spinner=False)
+def _storage_client():
+    from google.cloud import storage  # 배치 기능을 쓸 때만 로드
+    return storage.Client(project=PROJECT_ID, credentials=_credentials())
+
+def submit_batch(prompts: list) -> str:
+    # 프롬프트 → JSONL 업로드 → 배치 작업 제출, 작업 이름 반환
+    job_dir = f"{BATCH_PREFIX}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    lines = [json.dumps({"request": {"contents": [{"role": "user", "parts": [{"text": p}]}]}}, ensure_ascii=False)
+             for p in prompts]
+    _storage_client().bucket(BATCH_BUCKET).blob(f"{job_dir}/input.jsonl").upload_from_string(
+        "\n".join(lines).encode("utf-8"), content_type="application/jsonl")
+    job = client.batches.create(
+        model=BATCH_MODEL,
+        src=f"gs://{BATCH_BUCKET}/{job_dir}/input.jsonl",
+        config=types.CreateBatchJobConfig(dest=f"gs://{BATCH_BUCKET}/{job_dir}/output"),
     )
-    if st.button("기록 저장", type="primary"):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        st.session_state.log.append({
-            "timestamp": ts,
-            "prompt": st.session_state.last_prompt,
-            "ai_response": st.session_state.last_ai,
-            "approved_response": approved.strip(),
-            "used_model": st.session_state.used_model,
-        })
-        st.success("기록되었습니다. 아래에서 CSV로 내려받을 수 있습니다.")
+    return job.name
+
+def read_batch(job_name: str):
+    # 실행 중이면 None, 완료 시 [(prompt, 초안)]
+    job = client.batches.get(name=job_name)
+    state = getattr(job.state, "name", str(job.state))
+    if state not in ("JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"):
+        return None
+    if state != "JOB_STATE_SUCCEEDED":
+        raise RuntimeError(f"배치 작업 실패: {state} {job.error}")
+    bucket, _, prefix = job.dest.gcs_uri.removeprefix("gs://").partition("/")
+    out = []
+    for b in _storage_client().list_blobs(bucket, prefix=f"{prefix}/", match_glob="**/*.jsonl"):
+        for line in b.download_as_bytes().splitlines():
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            try:
+                prompt = r["request"]["contents"][0]["parts"][0]["text"]
+                parts = r["response"]["candidates"][0]["content"]["parts"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            text = "".join(p.get("text", "") for p in parts).strip()
+            if text:
+                out.append((prompt, text))
+    return out
+
+if BATCH_BUCKET and BATCH_MODEL and (st.session_state.batch_queue or st.session_state.batch_jobs):
+    with st.expander(f"🗃️ 배치 큐 (대기 {len(st.session_state.batch_queue)}건 · 작업 {len(st.session_state.batch_jobs)}개)"):
+        if st.session_state.batch_queue and st.button("배치 제출", key="batch_submit"):
+            ensure_client()
+            try:
+                st.session_state.batch_jobs.append(submit_batch(st.session_state.batch_queue))
+                st.session_state.batch_queue = []
+                st.success("배치 작업을 제출했습니다. 완료까지 수 분~수 시간 걸릴 수 있습니다.")
+            except Exception as e:
+                st.error("배치 제출 실패"); st.exception(e)
+        for job_name in list(st.session_state.batch_jobs):
+            st.caption(f"`{job_name}`")
+            if st.button("결과 확인", key=f"batch_check_{job_name}"):
+                ensure_client()
+                try:
+                    results = read_batch(job_name)
+                except Exception as e:
+                    st.session_state.batch_jobs.remove(job_name)
+                    st.error("배치 작업 실패"); st.exception(e)
+                    continue
+                if results is None:
+                    st.info("아직 실행 중입니다.")
+                    continue
+                ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for prompt_text, text in results:
+                    append_log({
+                        "timestamp": ts,
+                        "prompt": prompt_text,
+                        "ai_response": text,
+                        "approved_response": "",  # 배치 초안은 검토 전 상태로 기록
+                        "used_model": BATCH_MODEL,
+                    })
+                st.session_state.batch_jobs.remove(job_name)
+                st.success(f"{len(results)}건을 기록에 추가했습니다. (승인본은 비어 있음)")
 
 # ── 로그 다운로드 ──
-if st.session_state.log:
+def _clear_log():
+    reset_log()
+    st.toast("세션 로그를 비웠습니다.", icon="🧹")
+
+# fragment: 다운로드/비우기 클릭은 이 영역만 rerun (저장·생성 등 전체 실행 때는 함께 갱신됨)
+@st.fragment
+def log_section():
+    if not st.session_state.log_count:
+        return
     st.markdown("---")
     st.subheader("📝 피드백 기록 다운로드")
-    df = pd.DataFrame(st.session_state.log)
-    csv = df.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-    st.download_button("CSV 파일로 모든 기록 다운로드", data=csv, file_name="feedback_log.csv", mime="text/csv")
-    if st.button("세션 로그 비우기"):
-        st.session_state.log = []
-        st.success("세션 로그를 비웠습니다.")
+    # 파일 객체를 그대로 넘김 → 세션 상태에 로그 전체 바이트 사본을 따로 두지 않음
+    f = st.session_state.log_file
+    f.seek(0)
+    st.download_button("CSV 파일로 모든 기록 다운로드", data=f, file_name="feedback_log.csv", mime="text/csv")
+    st.button("세션 로그 비우기", on_click=_clear_log)
+
+log_section()